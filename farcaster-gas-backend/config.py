@@ -8,10 +8,20 @@ ETHEREUM_RPC = os.getenv("ETHEREUM_RPC", "https://eth-mainnet.g.alchemy.com/v2/d
 BASE_RPC = os.getenv("BASE_RPC", "https://mainnet.base.org")
 OPTIMISM_RPC = os.getenv("OPTIMISM_RPC", "https://mainnet.optimism.io")
 
+# Set to "false" for RPC providers that reject JSON-RPC batch requests
+RPC_BATCH_ENABLED = os.getenv("RPC_BATCH_ENABLED", "true").lower() == "true"
+
 # API Keys
 NEYNAR_API_KEY = os.getenv("NEYNAR_API_KEY", "")
 ETHERSCAN_API_KEY = os.getenv("ETHERSCAN_API_KEY", "")
 BASESCAN_API_KEY = os.getenv("BASESCAN_API_KEY", "")
 
+# Cache
+CACHE_TTL = int(os.getenv("CACHE_TTL", "120"))  # seconds to keep Neynar/Hub lookups
+
+# ETH price (CoinGecko), refreshed at most every ETH_PRICE_TTL seconds
+ETH_PRICE_TTL = int(os.getenv("ETH_PRICE_TTL", "300"))
+FALLBACK_ETH_PRICE_USD = float(os.getenv("FALLBACK_ETH_PRICE_USD", "3500"))
+
 # CORS
 CORS_ORIGINS = os.getenv("CORS_ORIGINS", "http://localhost:3000,http://localhost:3001").split(",")
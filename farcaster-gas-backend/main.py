@@ -3,24 +3,71 @@ Farcaster Gas Checker API
 FastAPI backend for checking gas usage by Farcaster username
 """
 
+import logging
+import queue
+from contextlib import asynccontextmanager
+from logging.handlers import QueueHandler, QueueListener
 from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from typing import Optional, List
 import config
 from services import (
     get_user_gas_info,
+    clean_username,
     username_to_fid,
     get_user_by_username,
     get_eth_addresses_from_neynar,
     determine_primary_wallet,
-    get_tx_count,
-    get_eth_balance,
+    get_user_by_fid,
+    get_wallet_infos,
+    open_http_client,
+    warm_http_client,
+    close_http_client,
+    UPSTREAM_TIMEOUT,
+    GAS_PROVIDER_UNAVAILABLE,
     w3_eth,
     w3_base
 )
 
+# Service warnings go through a bounded queue and are written to stderr by a
+# background thread, so error bursts (e.g. upstream rate limits) never block the
+# event loop. When the queue is full, new records are dropped.
+LOG_QUEUE_SIZE = 1000
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of erroring when the queue is full"""
+    
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+_log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+_log_listener = QueueListener(_log_queue, logging.StreamHandler())
+_services_logger = logging.getLogger("services")
+_services_logger.setLevel(logging.WARNING)
+_services_logger.addHandler(_DroppingQueueHandler(_log_queue))
+# Don't also hand records to root handlers, which would write on the event loop
+_services_logger.propagate = False
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open (and pre-connect) the shared upstream HTTP client for the lifetime of the app"""
+    _log_listener.start()
+    app.state.http_client = open_http_client()
+    await warm_http_client()
+    yield
+    await close_http_client()
+    _log_listener.stop()
+
+
 app = FastAPI(
+    lifespan=lifespan,
     title="Farcaster Gas Checker API",
     description="Check gas usage for Farcaster users by username",
     version="1.0.0"
@@ -41,6 +88,9 @@ app.add_middleware(
 # ============================================
 
 class WalletResponse(BaseModel):
+    # Built straight from services.WalletInfo dataclasses
+    model_config = ConfigDict(from_attributes=True)
+    
     address: str
     eth_tx_count: int
     base_tx_count: int
@@ -73,6 +123,19 @@ class QuickCheckResponse(BaseModel):
     error: Optional[str] = None
 
 
+class FidResponse(BaseModel):
+    username: str
+    fid: int
+
+
+class WalletsResponse(BaseModel):
+    username: str
+    fid: Optional[int]
+    wallet_count: int
+    primary_wallet: Optional[str]
+    wallets: List[WalletResponse]
+
+
 class HealthResponse(BaseModel):
     status: str
     ethereum_connected: bool
@@ -83,14 +146,16 @@ class HealthResponse(BaseModel):
 # ============================================
 # Endpoints
 # ============================================
+# Every endpoint declares a response_model: FastAPI then serializes the
+# response straight to JSON bytes with Pydantic's Rust core.
 
 @app.get("/", response_model=HealthResponse)
 async def health_check():
     """Health check endpoint"""
     return HealthResponse(
         status="ok",
-        ethereum_connected=w3_eth.is_connected(),
-        base_connected=w3_base.is_connected(),
+        ethereum_connected=await w3_eth.is_connected(),
+        base_connected=await w3_base.is_connected(),
         neynar_configured=bool(config.NEYNAR_API_KEY)
     )
 
@@ -109,35 +174,18 @@ async def check_gas(
     Full gas check for a Farcaster user.
     Returns all wallets, transaction counts, and gas usage.
     """
+    username = clean_username(username)
     if not username:
         raise HTTPException(status_code=400, detail="Username is required")
     
-    result = get_user_gas_info(username)
-    
-    wallets = [
-        WalletResponse(
-            address=w.address,
-            eth_tx_count=w.eth_tx_count,
-            base_tx_count=w.base_tx_count,
-            eth_balance=w.eth_balance,
-            is_primary=w.is_primary
-        )
-        for w in result.wallets
-    ]
+    result = await get_user_gas_info(username)
     
-    return GasCheckResponse(
-        success=result.error is None,
-        username=result.username,
-        fid=result.fid,
-        display_name=result.display_name,
-        pfp_url=result.pfp_url,
-        wallets=wallets,
-        primary_wallet=result.primary_wallet,
-        total_gas_used_eth=result.total_gas_used_eth,
-        total_gas_used_base=result.total_gas_used_base,
-        total_gas_usd=result.total_gas_usd,
-        error=result.error
-    )
+    # Validate the dataclass fields (and nested WalletInfo list) in one pass
+    return GasCheckResponse.model_validate({
+        # A partial result after upstream timeouts / explorer failures is still worth showing
+        "success": result.error in (None, UPSTREAM_TIMEOUT, GAS_PROVIDER_UNAVAILABLE),
+        **vars(result)
+    })
 
 
 @app.get("/api/quick", response_model=QuickCheckResponse)
@@ -148,19 +196,15 @@ async def quick_check(
     Quick check - just get FID and primary wallet without full gas calculation.
     Faster response for basic lookups.
     """
+    username = clean_username(username)
     if not username:
         raise HTTPException(status_code=400, detail="Username is required")
     
-    # Clean username
-    username = username.strip().lower()
-    if username.startswith("@"):
-        username = username[1:]
-    
     # Get user info
-    user_data = get_user_by_username(username)
+    user_data = await get_user_by_username(username)
     
     if not user_data:
-        fid = username_to_fid(username)
+        fid = await username_to_fid(username)
         if not fid:
             return QuickCheckResponse(
                 success=False,
@@ -173,8 +217,7 @@ async def quick_check(
                 error="User not found"
             )
         # Try to get user data by FID
-        from services import get_user_by_fid
-        user_data = get_user_by_fid(fid)
+        user_data = await get_user_by_fid(fid)
     
     if not user_data:
         return QuickCheckResponse(
@@ -194,7 +237,7 @@ async def quick_check(
     
     # Get addresses
     addresses = get_eth_addresses_from_neynar(user_data)
-    primary = determine_primary_wallet(addresses) if addresses else None
+    primary, _, _ = await determine_primary_wallet(addresses)
     
     return QuickCheckResponse(
         success=True,
@@ -207,59 +250,47 @@ async def quick_check(
     )
 
 
-@app.get("/api/fid/{username}")
+@app.get("/api/fid/{username}", response_model=FidResponse)
 async def get_fid(username: str):
     """Get FID for a username"""
-    username = username.strip().lower()
-    if username.startswith("@"):
-        username = username[1:]
+    username = clean_username(username)
     
-    fid = username_to_fid(username)
+    fid = await username_to_fid(username)
     
     if not fid:
         # Try Neynar direct lookup
-        user_data = get_user_by_username(username)
+        user_data = await get_user_by_username(username)
         if user_data:
             fid = user_data.get("fid")
     
     if not fid:
         raise HTTPException(status_code=404, detail="User not found")
     
-    return {"username": username, "fid": fid}
+    return FidResponse(username=username, fid=fid)
 
 
-@app.get("/api/wallets/{username}")
+@app.get("/api/wallets/{username}", response_model=WalletsResponse)
 async def get_wallets(username: str):
     """Get all verified wallets for a username"""
-    username = username.strip().lower()
-    if username.startswith("@"):
-        username = username[1:]
+    username = clean_username(username)
     
-    user_data = get_user_by_username(username)
+    user_data = await get_user_by_username(username)
     
     if not user_data:
         raise HTTPException(status_code=404, detail="User not found")
     
     addresses = get_eth_addresses_from_neynar(user_data)
-    primary = determine_primary_wallet(addresses) if addresses else None
+    primary, eth_stats, base_stats = await determine_primary_wallet(addresses)
     
-    wallets = []
-    for addr in addresses:
-        wallets.append({
-            "address": addr,
-            "eth_tx_count": get_tx_count(w3_eth, addr),
-            "base_tx_count": get_tx_count(w3_base, addr),
-            "eth_balance": get_eth_balance(w3_eth, addr),
-            "is_primary": addr.lower() == primary.lower() if primary else False
-        })
+    wallets = await get_wallet_infos(addresses, primary, eth_stats, base_stats)
     
-    return {
+    return WalletsResponse.model_validate({
         "username": username,
         "fid": user_data.get("fid"),
         "wallet_count": len(wallets),
         "primary_wallet": primary,
         "wallets": wallets
-    }
+    })
 
 
 # ============================================
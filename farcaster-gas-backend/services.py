@@ -6,16 +6,162 @@ Farcaster Gas Checker Service
 - Calculate gas usage
 """
 
-import requests
-from web3 import Web3
-from typing import Optional, List, Dict, Any
+import asyncio
+import contextvars
+import functools
+import logging
+import re
+import httpx
+from aiohttp import ClientTimeout
+import orjson
+from cachetools import LRUCache, TTLCache
+from web3 import AsyncWeb3, Web3
+from typing import Optional, List, Dict, Any, Tuple, Callable, Set
 from dataclasses import dataclass
 import config
 
-# Initialize Web3 connections
-w3_eth = Web3(Web3.HTTPProvider(config.ETHEREUM_RPC))
-w3_base = Web3(Web3.HTTPProvider(config.BASE_RPC))
-w3_optimism = Web3(Web3.HTTPProvider(config.OPTIMISM_RPC))
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# Hard cap for one upstream call including retries, in seconds
+UPSTREAM_TOTAL_TIMEOUT = 8.0
+
+# Initialize Web3 connections (same fail-fast budget as the shared HTTP client,
+# instead of web3's 30s default). web3's own retries are off: the timeout is per
+# attempt, so its 5 default retries would stretch one call to ~44s.
+_RPC_REQUEST_KWARGS = {"timeout": ClientTimeout(total=UPSTREAM_TOTAL_TIMEOUT, connect=2.0)}
+w3_eth = AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(
+    config.ETHEREUM_RPC, request_kwargs=_RPC_REQUEST_KWARGS, exception_retry_configuration=None
+))
+w3_base = AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(
+    config.BASE_RPC, request_kwargs=_RPC_REQUEST_KWARGS, exception_retry_configuration=None
+))
+w3_optimism = AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(
+    config.OPTIMISM_RPC, request_kwargs=_RPC_REQUEST_KWARGS, exception_retry_configuration=None
+))
+
+# Neynar key is only sent to Neynar, not to every host on the shared client
+_NEYNAR_HEADERS = {"x-api-key": config.NEYNAR_API_KEY}
+
+# Shared HTTP client - keeps TLS connections alive across Neynar/Hub/Etherscan calls.
+# Opened/closed by the FastAPI lifespan via open_http_client()/close_http_client().
+_http: Optional[httpx.AsyncClient] = None
+
+
+def open_http_client() -> httpx.AsyncClient:
+    """Create the shared HTTP client (call on app startup)"""
+    global _http
+    limits = httpx.Limits(max_keepalive_connections=50, max_connections=100)
+    _http = httpx.AsyncClient(
+        headers={"accept": "application/json"},
+        # Fail fast on a hung upstream: 2s to connect, 5s per read/write
+        timeout=httpx.Timeout(5.0, connect=2.0),
+        # Pool limits live on the transport when a custom transport is passed
+        transport=httpx.AsyncHTTPTransport(retries=2, limits=limits)
+    )
+    return _http
+
+
+def _client() -> httpx.AsyncClient:
+    """Return the shared HTTP client; helpers never create their own"""
+    if _http is None:
+        raise RuntimeError("HTTP client not open - call open_http_client() first")
+    return _http
+
+
+# GETs answered with these statuses are retried with exponential backoff
+_RETRY_STATUSES = {502, 503, 504}
+_RETRIES = 2
+_RETRY_BACKOFF = 0.2
+
+# UserGasInfo.error when some upstream calls timed out but the rest of the result is usable
+UPSTREAM_TIMEOUT = "upstream_timeout"
+
+# URLs that timed out during the current get_user_gas_info call (None outside of one)
+_upstream_timeouts: contextvars.ContextVar[Optional[List[str]]] = contextvars.ContextVar(
+    "upstream_timeouts", default=None
+)
+
+
+def _note_timeout(url: str) -> None:
+    """Record an upstream timeout for the current get_user_gas_info call, if any"""
+    timeouts = _upstream_timeouts.get()
+    if timeouts is not None:
+        timeouts.append(url)
+
+
+async def _request(method: str, url: str, **kwargs) -> httpx.Response:
+    """
+    Send a request on the shared client. GETs that hit a 502/503/504 are retried;
+    the whole exchange is capped at UPSTREAM_TOTAL_TIMEOUT and timeouts are recorded.
+    """
+    retries = _RETRIES if method == "GET" else 0
+    try:
+        async with asyncio.timeout(UPSTREAM_TOTAL_TIMEOUT):
+            for attempt in range(retries + 1):
+                r = await _client().request(method, url, **kwargs)
+                if r.status_code not in _RETRY_STATUSES or attempt == retries:
+                    return r
+                await asyncio.sleep(_RETRY_BACKOFF * 2 ** attempt)
+    except (httpx.TimeoutException, TimeoutError):
+        _note_timeout(url)
+        raise
+
+
+# Upstream hosts to pre-connect at startup so the first real request reuses a warm TLS socket
+_WARMUP_URLS = [
+    "https://api.neynar.com/",
+    "https://fnames.farcaster.xyz/",
+    "https://hub.pinata.cloud/",
+    "https://api.etherscan.io/",
+    "https://api.basescan.org/",
+    "https://api.coingecko.com/",
+    config.ETHEREUM_RPC,
+    config.BASE_RPC
+]
+
+
+async def warm_http_client() -> None:
+    """Open pooled connections to upstream hosts; responses and errors are ignored"""
+    await asyncio.gather(
+        *(_client().head(url, timeout=3.0) for url in _WARMUP_URLS),
+        return_exceptions=True
+    )
+
+
+async def close_http_client() -> None:
+    """Close the shared HTTP client (call on app shutdown)"""
+    global _http
+    if _http is not None:
+        await _http.aclose()
+        _http = None
+
+
+def _ttl_cached(
+    maxsize: int = 1024,
+    ttl: Optional[int] = None,
+    should_cache: Callable[[Any], bool] = bool
+):
+    """
+    Memoize an async lookup for `ttl` seconds (default config.CACHE_TTL), keyed by its arguments.
+    Only results passing `should_cache` are stored; by default empty results (None / [])
+    are skipped so upstream failures are retried.
+    """
+    def decorator(fn):
+        cache = TTLCache(maxsize=maxsize, ttl=ttl if ttl is not None else config.CACHE_TTL)
+        
+        @functools.wraps(fn)
+        async def wrapper(*args):
+            if args in cache:
+                return cache[args]
+            result = await fn(*args)
+            if should_cache(result):
+                cache[args] = result
+            return result
+        
+        wrapper.cache = cache
+        return wrapper
+    return decorator
 
 
 @dataclass
@@ -45,36 +191,37 @@ class UserGasInfo:
 # STEP 1: Username -> FID
 # ============================================
 
-def fname_to_fid(fname: str) -> Optional[int]:
+@_ttl_cached()
+async def fname_to_fid(fname: str) -> Optional[int]:
     """Convert Farcaster fname to FID using fnames registry"""
     try:
         url = f"https://fnames.farcaster.xyz/transfers/current?name={fname}"
-        r = requests.get(url, timeout=10)
+        r = await _request("GET", url)
         if r.status_code != 200:
             return None
         data = r.json()
         return data.get("transfer", {}).get("to")
     except Exception as e:
-        print(f"fname_to_fid error: {e}")
+        logger.warning("fname_to_fid error: %s", e)
         return None
 
 
-def ens_to_fid(ens_name: str) -> Optional[int]:
+async def ens_to_fid(ens_name: str) -> Optional[int]:
     """Resolve ENS name to ETH address, then find FID"""
     try:
-        # Resolve ENS to ETH address
-        eth_addr = w3_eth.ens.address(ens_name)
+        # Resolve ENS to ETH address (several RPC calls, so cap them as a whole)
+        try:
+            async with asyncio.timeout(UPSTREAM_TOTAL_TIMEOUT):
+                eth_addr = await w3_eth.ens.address(ens_name)
+        except TimeoutError:
+            _note_timeout(w3_eth.provider.endpoint_uri)
+            raise
         if not eth_addr:
             return None
         
         # Look up FID by ETH address via Neynar
         url = f"https://api.neynar.com/v2/farcaster/user/bulk-by-address?addresses={eth_addr}"
-        headers = {
-            "accept": "application/json",
-            "x-api-key": config.NEYNAR_API_KEY
-        }
-        
-        r = requests.get(url, headers=headers, timeout=10)
+        r = await _request("GET", url, headers=_NEYNAR_HEADERS)
         if r.status_code != 200:
             return None
         
@@ -84,25 +231,28 @@ def ens_to_fid(ens_name: str) -> Optional[int]:
             return None
         return users[0].get("fid")
     except Exception as e:
-        print(f"ens_to_fid error: {e}")
+        logger.warning("ens_to_fid error: %s", e)
         return None
 
 
-def username_to_fid(username: str) -> Optional[int]:
-    """Try fname first, then ENS"""
-    # Clean username
-    username = username.strip().lower()
-    if username.startswith("@"):
-        username = username[1:]
-    
+def clean_username(username: str) -> str:
+    """
+    Canonical form of a user-supplied username: trimmed, no leading "@", lowercase.
+    Applied once at the API boundary; the lookups below expect it and use it as cache key.
+    """
+    return username.strip().lstrip("@").lower()
+
+
+async def username_to_fid(username: str) -> Optional[int]:
+    """Try fname first, then ENS (expects a clean_username() result)"""
     # Try fname first
-    fid = fname_to_fid(username)
+    fid = await fname_to_fid(username)
     if fid:
         return fid
     
     # Try ENS if it looks like one
     if username.endswith(".eth"):
-        fid = ens_to_fid(username)
+        fid = await ens_to_fid(username)
     
     return fid
 
@@ -111,16 +261,12 @@ def username_to_fid(username: str) -> Optional[int]:
 # STEP 2: Get User Info from Neynar
 # ============================================
 
-def get_user_by_fid(fid: int) -> Optional[Dict[str, Any]]:
+@_ttl_cached()
+async def get_user_by_fid(fid: int) -> Optional[Dict[str, Any]]:
     """Get full user info from Neynar API"""
     try:
         url = f"https://api.neynar.com/v2/farcaster/user/bulk?fids={fid}"
-        headers = {
-            "accept": "application/json",
-            "x-api-key": config.NEYNAR_API_KEY
-        }
-        
-        r = requests.get(url, headers=headers, timeout=10)
+        r = await _request("GET", url, headers=_NEYNAR_HEADERS)
         if r.status_code != 200:
             return None
         
@@ -128,27 +274,23 @@ def get_user_by_fid(fid: int) -> Optional[Dict[str, Any]]:
         users = data.get("users", [])
         return users[0] if users else None
     except Exception as e:
-        print(f"get_user_by_fid error: {e}")
+        logger.warning("get_user_by_fid error: %s", e)
         return None
 
 
-def get_user_by_username(username: str) -> Optional[Dict[str, Any]]:
+@_ttl_cached()
+async def get_user_by_username(username: str) -> Optional[Dict[str, Any]]:
     """Get user info directly by username from Neynar"""
     try:
         url = f"https://api.neynar.com/v2/farcaster/user/by_username?username={username}"
-        headers = {
-            "accept": "application/json",
-            "x-api-key": config.NEYNAR_API_KEY
-        }
-        
-        r = requests.get(url, headers=headers, timeout=10)
+        r = await _request("GET", url, headers=_NEYNAR_HEADERS)
         if r.status_code != 200:
             return None
         
         data = r.json()
         return data.get("user")
     except Exception as e:
-        print(f"get_user_by_username error: {e}")
+        logger.warning("get_user_by_username error: %s", e)
         return None
 
 
@@ -156,15 +298,25 @@ def get_user_by_username(username: str) -> Optional[Dict[str, Any]]:
 # STEP 3: FID -> Verified ETH Addresses
 # ============================================
 
-def get_eth_addresses_from_hub(fid: int) -> List[str]:
-    """Get verified ETH addresses from Pinata Hub"""
+# Last Hub response per FID: (ETag, parsed addresses), for conditional GETs
+_hub_etags: LRUCache = LRUCache(maxsize=4096)
+
+
+@_ttl_cached()
+async def get_eth_addresses_from_hub(fid: int) -> List[str]:
+    """Get verified ETH addresses from Pinata Hub (revalidated with If-None-Match)"""
     try:
         url = f"https://hub.pinata.cloud/v1/verificationsByFid?fid={fid}"
-        r = requests.get(url, timeout=10)
+        cached = _hub_etags.get(fid)
+        headers = {"If-None-Match": cached[0]} if cached else {}
+        r = await _request("GET", url, headers=headers)
+        if r.status_code == 304 and cached:
+            # Unchanged since last time - reuse the parsed list
+            return cached[1]
         if r.status_code != 200:
             return []
         
-        data = r.json()
+        data = orjson.loads(r.content)
         messages = data.get("messages", [])
         eth_addresses = []
         
@@ -173,31 +325,33 @@ def get_eth_addresses_from_hub(fid: int) -> List[str]:
             if body.get("protocol") == "PROTOCOL_ETHEREUM" and body.get("address"):
                 eth_addresses.append(body["address"])
         
+        etag = r.headers.get("etag")
+        if etag:
+            _hub_etags[fid] = (etag, eth_addresses)
+        
         return eth_addresses
     except Exception as e:
-        print(f"get_eth_addresses_from_hub error: {e}")
+        logger.warning("get_eth_addresses_from_hub error: %s", e)
         return []
 
 
 def get_eth_addresses_from_neynar(user_data: Dict[str, Any]) -> List[str]:
-    """Extract verified addresses from Neynar user data"""
-    addresses = []
-    
-    # Get from verified_addresses
+    """Extract verified addresses from Neynar user data (deduped, case-insensitive)"""
+    # Get from verified_addresses, then verifications (legacy), then custody address
     verified = user_data.get("verified_addresses", {})
-    eth_addresses = verified.get("eth_addresses", [])
-    addresses.extend(eth_addresses)
+    sources = [
+        verified.get("eth_addresses", []),
+        user_data.get("verifications", []),
+        [user_data.get("custody_address")]
+    ]
     
-    # Also get from verifications (legacy)
-    verifications = user_data.get("verifications", [])
-    for v in verifications:
-        if v and v not in addresses:
-            addresses.append(v)
-    
-    # Get custody address
-    custody = user_data.get("custody_address")
-    if custody and custody not in addresses:
-        addresses.append(custody)
+    addresses = []
+    seen = set()
+    for source in sources:
+        for addr in source:
+            if addr and addr.lower() not in seen:
+                seen.add(addr.lower())
+                addresses.append(addr)
     
     return addresses
 
@@ -206,140 +360,412 @@ def get_eth_addresses_from_neynar(user_data: Dict[str, Any]) -> List[str]:
 # STEP 4: Transaction Count & Balance
 # ============================================
 
-def get_tx_count(w3: Web3, address: str) -> int:
-    """Get transaction count for an address"""
+_HEX_ADDRESS = re.compile(r"^0x[0-9a-fA-F]{40}$")
+
+
+def _to_rpc_addr(address: str) -> Optional[str]:
+    """
+    Address form for raw JSON-RPC params: nodes accept any-case hex, so a
+    cheap shape check replaces the Keccak checksum. None if not a hex address.
+    """
+    if not _HEX_ADDRESS.match(address):
+        return None
+    return address.lower()
+
+
+@functools.lru_cache(maxsize=4096)
+def _checksum(address: str) -> str:
+    """EIP-55 checksum an address, hashing each distinct address only once"""
+    return Web3.to_checksum_address(address)
+
+
+async def get_tx_count(w3: AsyncWeb3, address: str) -> Optional[int]:
+    """Get transaction count for an address (None if the lookup failed)"""
     try:
-        addr = Web3.to_checksum_address(address)
-        return w3.eth.get_transaction_count(addr)
+        addr = _checksum(address)
+        return await w3.eth.get_transaction_count(addr)
     except Exception as e:
-        print(f"get_tx_count error: {e}")
-        return 0
+        if isinstance(e, TimeoutError):
+            _note_timeout(w3.provider.endpoint_uri)
+        logger.warning("get_tx_count error: %s", e)
+        return None
 
 
-def get_eth_balance(w3: Web3, address: str) -> float:
-    """Get ETH balance in ETH units"""
+async def get_eth_balance(w3: AsyncWeb3, address: str) -> Optional[float]:
+    """Get ETH balance in ETH units (None if the lookup failed)"""
     try:
-        addr = Web3.to_checksum_address(address)
-        balance_wei = w3.eth.get_balance(addr)
+        addr = _checksum(address)
+        balance_wei = await w3.eth.get_balance(addr)
         return float(Web3.from_wei(balance_wei, 'ether'))
     except Exception as e:
-        print(f"get_eth_balance error: {e}")
-        return 0.0
+        if isinstance(e, TimeoutError):
+            _note_timeout(w3.provider.endpoint_uri)
+        logger.warning("get_eth_balance error: %s", e)
+        return None
+
+
+# Per-address (tx count, ETH balance); a value is None when its lookup failed,
+# so callers can tell "unknown" apart from a confirmed 0
+ChainStats = Dict[str, Tuple[Optional[int], Optional[float]]]
+
+
+def _hex_to_int(value: Any) -> Optional[int]:
+    """Parse a JSON-RPC hex quantity; None if it is missing or malformed"""
+    try:
+        return int(value, 16)
+    except (TypeError, ValueError):
+        return None
+
+
+async def batch_chain_stats(w3: AsyncWeb3, addresses: List[str]) -> ChainStats:
+    """
+    Get (tx count, ETH balance) for every address with one JSON-RPC batch POST.
+    Items the node answers with an error or a malformed result are retried as
+    individual calls, run concurrently under UPSTREAM_TOTAL_TIMEOUT. If the batch
+    itself timed out the node is treated as hung and those values are left
+    unknown (None).
+    """
+    if not addresses:
+        return {}
+    
+    rpc_addrs = [_to_rpc_addr(addr) for addr in addresses]
+    
+    payload = []
+    if config.RPC_BATCH_ENABLED:
+        for i, addr in enumerate(rpc_addrs):
+            if addr is None:
+                continue
+            payload.append({"jsonrpc": "2.0", "id": 2 * i, "method": "eth_getTransactionCount", "params": [addr, "latest"]})
+            payload.append({"jsonrpc": "2.0", "id": 2 * i + 1, "method": "eth_getBalance", "params": [addr, "latest"]})
+    
+    responses = {}
+    batch_timed_out = False
+    if payload:
+        try:
+            r = await _request("POST", w3.provider.endpoint_uri, json=payload)
+            data = r.json()
+            # Providers without batch support answer with a single error object
+            if isinstance(data, list):
+                responses = {item.get("id"): item for item in data}
+        except Exception as e:
+            batch_timed_out = isinstance(e, (httpx.TimeoutException, TimeoutError))
+            logger.warning("batch_chain_stats error: %s", e)
+    
+    stats: ChainStats = {}
+    for i, addr in enumerate(addresses):
+        if rpc_addrs[i] is None:
+            stats[addr] = (0, 0.0)
+            continue
+        
+        # Missing or malformed results stay None, so fill() retries them individually
+        count = _hex_to_int(responses.get(2 * i, {}).get("result"))
+        balance = _hex_to_int(responses.get(2 * i + 1, {}).get("result"))
+        stats[addr] = (
+            count,
+            float(Web3.from_wei(balance, 'ether')) if balance is not None else None
+        )
+    
+    async def fill(addr: str) -> None:
+        tx_count, eth_balance = stats[addr]
+        if tx_count is None:
+            tx_count = await get_tx_count(w3, addr)
+        if eth_balance is None:
+            eth_balance = await get_eth_balance(w3, addr)
+        stats[addr] = (tx_count, eth_balance)
+    
+    # Retrying against a node that just timed out would only hang again
+    missing = [addr for addr, (c, b) in stats.items() if c is None or b is None]
+    if missing and not batch_timed_out:
+        try:
+            async with asyncio.timeout(UPSTREAM_TOTAL_TIMEOUT):
+                await asyncio.gather(*(fill(addr) for addr in missing))
+        except TimeoutError:
+            _note_timeout(w3.provider.endpoint_uri)
+            logger.warning("batch_chain_stats error: fallback calls timed out")
+    
+    return stats
 
 
 # ============================================
 # STEP 5: Gas Usage Calculation
 # ============================================
 
-def get_gas_used_etherscan(address: str, api_key: str, base_url: str) -> float:
-    """Calculate total gas used from Etherscan/Basescan API"""
+# Running gas totals per (explorer, address): {"last_block": int, "total_wei": int}
+_gas_cache: LRUCache = LRUCache(maxsize=4096)
+
+# Etherscan returns at most this many records per txlist query
+ETHERSCAN_MAX_RECORDS = 10000
+
+# UserGasInfo.error when an explorer failed and some gas totals are cached/partial
+GAS_PROVIDER_UNAVAILABLE = "gas_provider_unavailable"
+
+# Explorers that failed during the current get_user_gas_info call (None outside of one);
+# the remaining lookups in that request stop querying them instead of retrying
+_explorers_down: contextvars.ContextVar[Optional[Set[str]]] = contextvars.ContextVar(
+    "explorers_down", default=None
+)
+
+
+async def get_gas_used_etherscan(address: str, api_key: str, base_url: str) -> float:
+    """
+    Calculate total gas used from Etherscan/Basescan API.
+    Totals are kept per address, so repeat calls only fetch blocks after the last one seen.
+    """
+    addr_lc = address.lower()
+    key = (base_url, addr_lc)
+    cached = dict(_gas_cache.get(key, {"last_block": -1, "total_wei": 0}))
+    
+    last_block = cached["last_block"]
+    total_gas_wei = cached["total_wei"]
+    explorers_down = _explorers_down.get()
+    
+    failed = False
+    errored = False
     try:
         url = f"{base_url}/api"
-        params = {
-            "module": "account",
-            "action": "txlist",
-            "address": address,
-            "startblock": 0,
-            "endblock": 99999999,
-            "sort": "desc",
-            "apikey": api_key
-        }
-        
-        r = requests.get(url, params=params, timeout=15)
-        if r.status_code != 200:
-            return 0.0
-        
-        data = r.json()
-        if data.get("status") != "1":
-            return 0.0
-        
-        transactions = data.get("result", [])
-        total_gas_wei = 0
-        
-        for tx in transactions:
-            # Only count transactions FROM this address (sender pays gas)
-            if tx.get("from", "").lower() == address.lower():
-                gas_used = int(tx.get("gasUsed", 0))
-                gas_price = int(tx.get("gasPrice", 0))
-                total_gas_wei += gas_used * gas_price
-        
-        return float(Web3.from_wei(total_gas_wei, 'ether'))
+        while True:
+            if explorers_down is not None and base_url in explorers_down:
+                # Failed earlier in this request - keep the cached/partial total
+                break
+            params = {
+                "module": "account",
+                "action": "txlist",
+                "address": address,
+                "startblock": last_block + 1,
+                "endblock": 99999999,
+                "sort": "asc",
+                "apikey": api_key
+            }
+            
+            r = await _request("GET", url, params=params)
+            if r.status_code != 200:
+                failed = True
+                break
+            
+            data = orjson.loads(r.content)
+            if data.get("status") != "1":
+                # "No transactions found" just means nothing new since last_block
+                failed = data.get("message") != "No transactions found"
+                break
+            
+            transactions = data.get("result", [])
+            truncated = len(transactions) >= ETHERSCAN_MAX_RECORDS
+            if truncated:
+                # The last block may be cut off mid-way; drop it and re-fetch it next page
+                cut_block = transactions[-1]["blockNumber"]
+                while transactions and transactions[-1]["blockNumber"] == cut_block:
+                    transactions.pop()
+            
+            # Only count transactions FROM this address (sender pays gas).
+            # Etherscan returns "from" lowercased, so compare directly.
+            page_wei = 0
+            for tx in transactions:
+                if tx["from"] == addr_lc:
+                    page_wei += int(tx["gasUsed"]) * int(tx["gasPrice"])
+            
+            # Results are sorted ascending, so the last one is the newest block.
+            # Total and block advance together, only once the whole page parsed.
+            if transactions:
+                last_block = int(transactions[-1]["blockNumber"])
+                total_gas_wei += page_wei
+            
+            if not truncated or not transactions:
+                break
     except Exception as e:
-        print(f"get_gas_used_etherscan error: {e}")
-        return 0.0
+        logger.warning("get_gas_used_etherscan error: %s", e)
+        failed = True
+        errored = True
+    
+    if failed and explorers_down is not None:
+        explorers_down.add(base_url)
+    
+    current = _gas_cache.get(key)
+    if errored:
+        # Don't persist anything from a call that blew up mid-way;
+        # the total only holds fully-parsed pages, so it is still safe to return
+        return float(Web3.from_wei(total_gas_wei, 'ether'))
+    
+    # Only store if no concurrent call advanced this address meanwhile
+    if current is None or current["last_block"] == cached["last_block"]:
+        _gas_cache[key] = {"last_block": last_block, "total_wei": total_gas_wei}
+    else:
+        total_gas_wei = current["total_wei"]
+    
+    return float(Web3.from_wei(total_gas_wei, 'ether'))
 
 
-def get_gas_used_ethereum(address: str) -> float:
+async def get_gas_used_ethereum(address: str) -> float:
     """Get total gas used on Ethereum mainnet"""
-    return get_gas_used_etherscan(
+    return await get_gas_used_etherscan(
         address,
         config.ETHERSCAN_API_KEY,
         "https://api.etherscan.io"
     )
 
 
-def get_gas_used_base(address: str) -> float:
+async def get_gas_used_base(address: str) -> float:
     """Get total gas used on Base"""
-    return get_gas_used_etherscan(
+    return await get_gas_used_etherscan(
         address,
         config.BASESCAN_API_KEY,
         "https://api.basescan.org"
     )
 
 
+COINGECKO_ETH_PRICE_URL = "https://api.coingecko.com/api/v3/simple/price?ids=ethereum&vs_currencies=usd"
+
+# Last ETH/USD price fetched successfully; served whenever CoinGecko is unavailable
+_last_eth_price_usd: float = config.FALLBACK_ETH_PRICE_USD
+
+
+@_ttl_cached(maxsize=1, ttl=config.ETH_PRICE_TTL)
+async def get_eth_price_usd() -> float:
+    """Get the ETH/USD price, fetched at most once per ETH_PRICE_TTL"""
+    global _last_eth_price_usd
+    try:
+        # Plain client call, not _request(): a slow price feed falls back to the
+        # last known price and must not mark the gas result as upstream_timeout
+        r = await _client().get(COINGECKO_ETH_PRICE_URL, timeout=3.0)
+        if r.status_code == 200:
+            _last_eth_price_usd = float(orjson.loads(r.content)["ethereum"]["usd"])
+    except Exception as e:
+        logger.warning("get_eth_price_usd error: %s", e)
+    return _last_eth_price_usd
+
+
 # ============================================
 # STEP 6: Determine Primary Wallet
 # ============================================
 
-def determine_primary_wallet(addresses: List[str]) -> Optional[str]:
+async def get_chain_stats(addresses: List[str]) -> Tuple[ChainStats, ChainStats]:
+    """Get (eth_stats, base_stats) for the addresses, one batch per chain fetched together"""
+    return await asyncio.gather(
+        batch_chain_stats(w3_eth, addresses),
+        batch_chain_stats(w3_base, addresses)
+    )
+
+
+def _chain_stats_complete(result: Tuple[ChainStats, ChainStats]) -> bool:
+    """True if every count and balance in (eth_stats, base_stats) was actually fetched"""
+    return all(
+        value is not None
+        for stats in result
+        for pair in stats.values()
+        for value in pair
+    )
+
+
+@_ttl_cached(should_cache=_chain_stats_complete)
+async def _cached_chain_stats(addresses: Tuple[str, ...]) -> Tuple[ChainStats, ChainStats]:
+    """
+    Chain stats for a sorted tuple of lowercase addresses. Cached only when no
+    lookup failed, so a degraded RPC result is never reused.
+    """
+    return await get_chain_stats(list(addresses))
+
+
+def _pick_primary_wallet(addresses: List[str], eth_stats: ChainStats, base_stats: ChainStats) -> str:
+    """Apply the primary-wallet rule over `addresses` in the caller's order"""
+    # Unknown counts rank as 0 here, as they always have
+    eth_tx_map = {addr: eth_stats[addr][0] or 0 for addr in addresses}
+    
+    # Find addresses with 0 ETH transactions
+    zero_eth_addresses = [addr for addr, tx in eth_tx_map.items() if tx == 0]
+    
+    # Single-pass argmax/argmin; ties keep the first address, like max()/min()
+    primary = None
+    if zero_eth_addresses:
+        # Check Base transactions for zero-ETH addresses; pick the most Base activity
+        best = -1
+        for addr in zero_eth_addresses:
+            base_tx = base_stats[addr][0] or 0
+            if base_tx > best:
+                primary, best = addr, base_tx
+    else:
+        # All have ETH txns - pick the one with lowest (likely signing wallet)
+        best = None
+        for addr, tx in eth_tx_map.items():
+            if best is None or tx < best:
+                primary, best = addr, tx
+    
+    return primary
+
+
+async def determine_primary_wallet(
+    addresses: List[str]
+) -> Tuple[Optional[str], ChainStats, ChainStats]:
     """
     Determine primary wallet based on transaction activity.
     Logic: 
     - If any wallet has 0 ETH mainnet txns, check Base txns and pick highest
     - Otherwise, pick wallet with lowest ETH txns (likely signing wallet)
+    Ties go to the earliest address in `addresses`.
+    
+    Returns (primary, eth_stats, base_stats) so callers can reuse the counts
+    instead of re-fetching them. The stats are empty when no lookup was needed.
     """
     if not addresses:
-        return None
+        return None, {}, {}
     
     if len(addresses) == 1:
-        return addresses[0]
+        return addresses[0], {}, {}
     
-    # Get ETH mainnet tx counts
-    eth_tx_map = {addr: get_tx_count(w3_eth, addr) for addr in addresses}
+    # The same wallets in any order or case share one cached stats lookup
+    lowered = tuple(sorted({addr.lower() for addr in addresses}))
+    eth_by_lower, base_by_lower = await _cached_chain_stats(lowered)
+    eth_stats = {addr: eth_by_lower[addr.lower()] for addr in addresses}
+    base_stats = {addr: base_by_lower[addr.lower()] for addr in addresses}
     
-    # Find addresses with 0 ETH transactions
-    zero_eth_addresses = [addr for addr, tx in eth_tx_map.items() if tx == 0]
+    return _pick_primary_wallet(addresses, eth_stats, base_stats), eth_stats, base_stats
+
+
+async def get_wallet_infos(
+    addresses: List[str],
+    primary: Optional[str],
+    eth_stats: Optional[ChainStats] = None,
+    base_stats: Optional[ChainStats] = None
+) -> List[WalletInfo]:
+    """Build WalletInfo for every address, fetching chain stats only if not supplied"""
+    if not eth_stats or not base_stats:
+        eth_stats, base_stats = await get_chain_stats(addresses)
     
-    if zero_eth_addresses:
-        # Check Base transactions for zero-ETH addresses
-        base_tx_map = {addr: get_tx_count(w3_base, addr) for addr in zero_eth_addresses}
-        # Return the one with most Base activity
-        return max(base_tx_map, key=lambda a: base_tx_map[a])
-    else:
-        # All have ETH txns - return one with lowest (likely signing wallet)
-        return min(eth_tx_map, key=lambda a: eth_tx_map[a])
+    # Values that could not be fetched are reported as 0
+    return [
+        WalletInfo(
+            address=addr,
+            eth_tx_count=eth_stats[addr][0] or 0,
+            base_tx_count=base_stats[addr][0] or 0,
+            eth_balance=eth_stats[addr][1] or 0.0,
+            is_primary=(addr.lower() == primary.lower() if primary else False)
+        )
+        for addr in addresses
+    ]
 
 
 # ============================================
 # MAIN: Get Complete Gas Info
 # ============================================
 
-def get_user_gas_info(username: str) -> UserGasInfo:
-    """Main function to get complete gas info for a Farcaster user"""
-    
-    # Clean username
-    username = username.strip().lower()
-    if username.startswith("@"):
-        username = username[1:]
+async def get_user_gas_info(username: str) -> UserGasInfo:
+    """
+    Main function to get complete gas info for a Farcaster user
+    (username must already be cleaned with clean_username()).
+    If some upstream calls time out or an explorer fails, the rest of the result
+    is still returned with error=UPSTREAM_TIMEOUT / GAS_PROVIDER_UNAVAILABLE.
+    """
+    timeouts: List[str] = []
+    _upstream_timeouts.set(timeouts)
+    explorers_down: Set[str] = set()
+    _explorers_down.set(explorers_down)
     
     # Get user info from Neynar first (more reliable)
-    user_data = get_user_by_username(username)
+    user_data = await get_user_by_username(username)
     
     if not user_data:
         # Try FID lookup
-        fid = username_to_fid(username)
+        fid = await username_to_fid(username)
         if fid:
-            user_data = get_user_by_fid(fid)
+            user_data = await get_user_by_fid(fid)
     
     if not user_data:
         return UserGasInfo(
@@ -363,9 +789,11 @@ def get_user_gas_info(username: str) -> UserGasInfo:
     addresses = get_eth_addresses_from_neynar(user_data)
     
     # Also try hub for more addresses
-    hub_addresses = get_eth_addresses_from_hub(fid) if fid else []
+    hub_addresses = await get_eth_addresses_from_hub(fid) if fid else []
+    seen = {addr.lower() for addr in addresses}
     for addr in hub_addresses:
-        if addr and addr not in addresses:
+        if addr and addr.lower() not in seen:
+            seen.add(addr.lower())
             addresses.append(addr)
     
     if not addresses:
@@ -382,41 +810,36 @@ def get_user_gas_info(username: str) -> UserGasInfo:
             error="No verified wallets found"
         )
     
-    # Determine primary wallet
-    primary = determine_primary_wallet(addresses)
+    # Tx counts come from the primary-wallet decision and are reused below
+    primary, eth_stats, base_stats = await determine_primary_wallet(addresses)
+    if not eth_stats or not base_stats:
+        eth_stats, base_stats = await get_chain_stats(addresses)
+    wallets = await get_wallet_infos(addresses, primary, eth_stats, base_stats)
     
-    # Get wallet info for each address
-    wallets = []
-    total_gas_eth = 0.0
-    total_gas_base = 0.0
+    async def no_gas() -> float:
+        return 0.0
     
-    for addr in addresses:
-        eth_tx = get_tx_count(w3_eth, addr)
-        base_tx = get_tx_count(w3_base, addr)
-        eth_balance = get_eth_balance(w3_eth, addr)
-        
-        # Get gas usage (if API keys available)
-        gas_eth = 0.0
-        gas_base = 0.0
-        
-        if config.ETHERSCAN_API_KEY:
-            gas_eth = get_gas_used_ethereum(addr)
-        if config.BASESCAN_API_KEY:
-            gas_base = get_gas_used_base(addr)
-        
-        total_gas_eth += gas_eth
-        total_gas_base += gas_base
-        
-        wallets.append(WalletInfo(
-            address=addr,
-            eth_tx_count=eth_tx,
-            base_tx_count=base_tx,
-            eth_balance=eth_balance,
-            is_primary=(addr.lower() == primary.lower() if primary else False)
-        ))
+    # Get gas usage (if API keys available). The tx count is the sender nonce,
+    # so a wallet with a confirmed 0 txs on a chain has paid no gas there - skip
+    # the explorer. An unknown count (None, lookup failed) still queries it.
+    gas_eth_tasks = [
+        get_gas_used_ethereum(addr) if eth_stats[addr][0] != 0 and config.ETHERSCAN_API_KEY else no_gas()
+        for addr in addresses
+    ]
+    gas_base_tasks = [
+        get_gas_used_base(addr) if base_stats[addr][0] != 0 and config.BASESCAN_API_KEY else no_gas()
+        for addr in addresses
+    ]
+    gas_eth, gas_base, eth_price_usd = await asyncio.gather(
+        asyncio.gather(*gas_eth_tasks),
+        asyncio.gather(*gas_base_tasks),
+        get_eth_price_usd()
+    )
     
-    # Calculate USD value (rough estimate: ETH at ~$3500, Base gas much cheaper)
-    eth_price_usd = 3500  # You should fetch real price
+    total_gas_eth = sum(gas_eth)
+    total_gas_base = sum(gas_base)
+    
+    # Calculate USD value (rough estimate: Base gas much cheaper)
     total_gas_usd = (total_gas_eth * eth_price_usd) + (total_gas_base * eth_price_usd * 0.01)
     
     return UserGasInfo(
@@ -428,15 +851,28 @@ def get_user_gas_info(username: str) -> UserGasInfo:
         primary_wallet=primary,
         total_gas_used_eth=total_gas_eth,
         total_gas_used_base=total_gas_base,
-        total_gas_usd=total_gas_usd
+        total_gas_usd=total_gas_usd,
+        error=(
+            UPSTREAM_TIMEOUT if timeouts
+            else GAS_PROVIDER_UNAVAILABLE if explorers_down
+            else None
+        )
     )
 
 
 # Quick test
 if __name__ == "__main__":
     import sys
-    username = sys.argv[1] if len(sys.argv) > 1 else "dwr.eth"
-    result = get_user_gas_info(username)
+    username = clean_username(sys.argv[1] if len(sys.argv) > 1 else "dwr.eth")
+    
+    async def run() -> UserGasInfo:
+        open_http_client()
+        try:
+            return await get_user_gas_info(username)
+        finally:
+            await close_http_client()
+    
+    result = asyncio.run(run())
     print(f"\n=== Gas Info for {username} ===")
     print(f"FID: {result.fid}")
     print(f"Display Name: {result.display_name}")